@@ -1,5 +1,7 @@
 import { FoodDetectionService } from '../services/FoodDetectionService.js';
 import fs from 'fs';
+import net from 'net';
+import os from 'os';
 import path from 'path';
 
 describe('FoodDetectionService', () => {
@@ -237,6 +239,107 @@ describe('FoodDetectionService', () => {
     });
   });
 
+  describe('resident detection service', () => {
+    let server: net.Server;
+    let socketPath: string;
+    let receivedRequests: Array<{ image: string; max_detections: number }>;
+
+    const startServer = (reply: object) => new Promise<void>((resolve) => {
+      server = net.createServer((connection) => {
+        let buffer = '';
+        connection.on('data', (data) => {
+          buffer += data.toString();
+          if (buffer.includes('\n')) {
+            receivedRequests.push(JSON.parse(buffer.trim()));
+            connection.write(JSON.stringify(reply) + '\n');
+          }
+        });
+      });
+      server.listen(socketPath, resolve);
+    });
+
+    beforeEach(() => {
+      socketPath = path.join(os.tmpdir(), `food-detector-test-${process.pid}-${Date.now()}.sock`);
+      receivedRequests = [];
+    });
+
+    afterEach((done) => {
+      if (server) {
+        server.close(() => done());
+      } else {
+        done();
+      }
+    });
+
+    it('should send requests over the socket instead of spawning Python', async () => {
+      await startServer({
+        detections: [
+          {
+            class_name: 'hot_dog',
+            confidence: 0.8,
+            bbox: [10, 20, 30, 40],
+            alternatives: []
+          }
+        ],
+        processing_time: 0.03,
+        model_info: {
+          name: 'YOLOv8-Food101',
+          version: '1.0.0'
+        }
+      });
+
+      const originalSpawn = require('child_process').spawn;
+      const mockSpawn = jest.fn();
+      require('child_process').spawn = mockSpawn;
+
+      const service = new FoodDetectionService({ socketPath, maxDetections: 3 });
+      const results = await service.detectFood(mockImageBuffer);
+
+      expect(mockSpawn).not.toHaveBeenCalled();
+      expect(receivedRequests).toHaveLength(1);
+      expect(receivedRequests[0].max_detections).toBe(3);
+      expect(path.isAbsolute(receivedRequests[0].image)).toBe(true);
+      expect(results).toHaveLength(1);
+      expect(results[0].food.name).toBe('Hot Dog');
+      expect(results[0].boundingBox).toEqual({ x: 10, y: 20, width: 30, height: 40 });
+
+      require('child_process').spawn = originalSpawn;
+    });
+
+    it('should surface errors reported by the service', async () => {
+      await startServer({
+        error: 'Could not load image',
+        detections: [],
+        processing_time: 0,
+        model_info: {
+          name: 'YOLOv8-Food101',
+          version: '1.0.0'
+        }
+      });
+
+      const service = new FoodDetectionService({ socketPath });
+
+      await expect(service.detectFood(mockImageBuffer))
+        .rejects
+        .toThrow('Could not load image');
+    });
+
+    it('should reject when the service closes the connection without replying', async () => {
+      await new Promise<void>((resolve) => {
+        server = net.createServer((connection) => {
+          connection.on('data', () => connection.end());
+        });
+        server.listen(socketPath, resolve);
+      });
+
+      const service = new FoodDetectionService({ socketPath });
+
+      await expect(service.detectFood(mockImageBuffer))
+        .rejects
+        .toThrow('closed the connection without a response');
+    });
+  });
+
   describe('validateFoodImage', () => {
     it('should return false when no food is detected', async () => {
       // Mock detectFood to return empty results
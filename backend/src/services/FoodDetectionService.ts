@@ -1,4 +1,5 @@
 import { spawn } from 'child_process';
+import net from 'net';
 import path from 'path';
 import fs from 'fs';
 import type { FoodDetectionResult, FoodItem, BoundingBox } from '../types/core.js';
@@ -8,6 +9,7 @@ export interface FoodDetectionConfig {
   modelPath?: string;
   confidenceThreshold?: number;
   maxDetections?: number;
+  socketPath?: string; // Unix socket of a `food_detection.py --serve` process
 }
 
 export interface PythonDetectionResult {
@@ -25,6 +27,7 @@ export interface PythonDetectionResult {
     name: string;
     version: string;
   };
+  error?: string;
 }
 
 export class FoodDetectionService {
@@ -37,6 +40,7 @@ export class FoodDetectionService {
       modelPath: config.modelPath || path.join(process.cwd(), 'ml_models'),
       confidenceThreshold: config.confidenceThreshold || 0.5,
       maxDetections: config.maxDetections || 5,
+      socketPath: config.socketPath || process.env.FOOD_DETECTION_SOCKET,
       ...config
     };
     
@@ -52,8 +56,10 @@ export class FoodDetectionService {
       const tempImagePath = await this.saveTemporaryImage(imageBuffer);
       
       try {
-        // Run Python food detection script
-        const pythonResult = await this.runPythonDetection(tempImagePath);
+        // Use the resident detection service when configured, otherwise spawn the script
+        const pythonResult = this.config.socketPath
+          ? await this.runSocketDetection(tempImagePath)
+          : await this.runPythonDetection(tempImagePath);
         
         // Convert Python results to our format
         const detectionResults = this.convertPythonResults(pythonResult);
@@ -215,6 +221,61 @@ export class FoodDetectionService {
     });
   }
 
+  /**
+   * Send a detection request to the resident Python service over its Unix socket
+   */
+  private async runSocketDetection(imagePath: string): Promise<PythonDetectionResult> {
+    return new Promise((resolve, reject) => {
+      const socket = net.createConnection(this.config.socketPath!);
+      let buffer = '';
+
+      socket.setEncoding('utf8');
+      socket.setTimeout(30000); // 30 second timeout
+
+      socket.on('connect', () => {
+        socket.write(JSON.stringify({
+          image: path.resolve(imagePath),
+          max_detections: this.config.maxDetections
+        }) + '\n');
+      });
+
+      socket.on('data', (data) => {
+        buffer += data;
+        const newlineIndex = buffer.indexOf('\n');
+        if (newlineIndex === -1) {
+          return;
+        }
+
+        socket.end();
+        try {
+          const result = JSON.parse(buffer.slice(0, newlineIndex)) as PythonDetectionResult;
+          if (result.error) {
+            reject(new Error(`Detection service error: ${result.error}`));
+            return;
+          }
+          resolve(result);
+        } catch (error) {
+          reject(new Error(`Failed to parse detection service output: ${error instanceof Error ? error.message : 'Unknown error'}`));
+        }
+      });
+
+      socket.on('timeout', () => {
+        socket.destroy();
+        reject(new Error('Food detection timeout - service took too long'));
+      });
+
+      socket.on('error', (error) => {
+        reject(new Error(`Failed to connect to detection service: ${error.message}`));
+      });
+
+      // The service may close the connection without replying (crash, restart or idle timeout).
+      // A no-op when the promise has already settled
+      socket.on('close', () => {
+        reject(new Error('Detection service closed the connection without a response'));
+      });
+    });
+  }
+
   /**
    * Convert Python detection results to our TypeScript format
    */
@@ -4,262 +4,915 @@ Food Detection Service using YOLOv8 and Food-101 dataset
 This service provides food detection capabilities for the Food Nutrition Detector application.
 """
 
+from __future__ import annotations
+
 import argparse
+import contextlib
+import hashlib
+import heapq
 import json
+import os
+import shutil
+import socket
+import socketserver
+import stat
 import sys
 import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from types import MappingProxyType
+from typing import List, Dict, Mapping, Tuple, Optional
 import logging
 
-try:
-    import cv2
-    import numpy as np
-    from ultralytics import YOLO
-    import torch
-    from PIL import Image
-except ImportError as e:
-    print(f"Error: Missing required dependencies: {e}", file=sys.stderr)
-    print("Please install required packages: pip install ultralytics opencv-python pillow torch", file=sys.stderr)
-    sys.exit(1)
+# Heavy dependencies are imported on first use by _import_dependencies(), so `--help` and
+# argument errors return without paying for the torch/ultralytics import
+cv2 = None
+np = None
+torch = None
+F = None
+torchvision = None
+ImageReadMode = None
+Image = None
+YOLO = None
+AutoBackend = None
+Boxes = None
+non_max_suppression = None
+
+def _import_dependencies():
+    """Import the imaging and ML libraries into module scope, once"""
+    global cv2, np, torch, F, torchvision, ImageReadMode, Image, YOLO, AutoBackend, Boxes, non_max_suppression
+    if YOLO is not None:
+        return
+    
+    try:
+        import cv2
+        import numpy as np
+        import torch
+        import torch.nn.functional as F
+        import torchvision
+        from torchvision.io import ImageReadMode
+        from PIL import Image
+        from ultralytics import YOLO
+        from ultralytics.nn.autobackend import AutoBackend
+        from ultralytics.engine.results import Boxes
+        try:
+            from ultralytics.utils.nms import non_max_suppression
+        except ImportError:
+            # Ultralytics releases before the NMS helpers moved out of ops
+            from ultralytics.utils.ops import non_max_suppression
+    except ImportError as e:
+        raise RuntimeError(
+            f"Missing required dependencies: {e}. Please install required packages: "
+            "pip install ultralytics opencv-python pillow torch torchvision"
+        )
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Exported inference engines are cached here so they are only built once per host
+CACHE_DIR = Path.home() / '.cache' / 'food-detector'
+# Detection results are cached by image content so re-uploaded photos skip inference
+RESULT_CACHE_DIR = CACHE_DIR / 'results'
+RESULT_MEMORY_CACHE_SIZE = 128
+RESULT_DISK_CACHE_SIZE = 1000  # Oldest cached results beyond this many are deleted on write
+DEFAULT_WEIGHTS = 'yolov8n.pt'  # Nano version for faster inference
+INFERENCE_SIZE = 640
+MAX_BATCH_SIZE = 8
+LETTERBOX_COLOR = (114, 114, 114)  # Padding colour used by Ultralytics
+NMS_IOU_THRESHOLD = 0.7  # Ultralytics' predict default
+CUDA_GRAPH_WARMUP_RUNS = 3
+EXIF_ORIENTATION_TAG = 0x0112
+DEFAULT_SOCKET_PATH = '/tmp/food-detector.sock'
+CONNECTION_TIMEOUT = 30  # Seconds a --serve client may stay idle, matching the backend's timeout
+# Pending --serve connections the kernel queues while one request is being handled.
+# Clients beyond the backlog are refused instead of waiting their turn
+REQUEST_QUEUE_SIZE = 128
+
+# Mapping common YOLO classes to food categories, matched as substrings of the YOLO class name
+_FOOD_MAPPINGS = (
+    ('apple', 'apple_pie'),
+    ('banana', 'banana'),
+    ('orange', 'orange'),
+    ('sandwich', 'club_sandwich'),
+    ('pizza', 'pizza'),
+    ('donut', 'donuts'),
+    ('cake', 'chocolate_cake'),
+    ('hot dog', 'hot_dog'),
+    ('hamburger', 'hamburger'),
+    ('french fries', 'french_fries')
+)
+_EXACT_FOOD_MAPPINGS = dict(_FOOD_MAPPINGS)
+
+# Food-101 dataset class names, shared by every model instance
+_FOOD101_CLASSES = (
+    'apple_pie', 'baby_back_ribs', 'baklava', 'beef_carpaccio', 'beef_tartare',
+    'beet_salad', 'beignets', 'bibimbap', 'bread_pudding', 'breakfast_burrito',
+    'bruschetta', 'caesar_salad', 'cannoli', 'caprese_salad', 'carrot_cake',
+    'ceviche', 'cheese_plate', 'cheesecake', 'chicken_curry', 'chicken_quesadilla',
+    'chicken_wings', 'chocolate_cake', 'chocolate_mousse', 'churros', 'clam_chowder',
+    'club_sandwich', 'crab_cakes', 'creme_brulee', 'croque_madame', 'cup_cakes',
+    'deviled_eggs', 'donuts', 'dumplings', 'edamame', 'eggs_benedict',
+    'escargots', 'falafel', 'filet_mignon', 'fish_and_chips', 'foie_gras',
+    'french_fries', 'french_onion_soup', 'french_toast', 'fried_calamari', 'fried_rice',
+    'frozen_yogurt', 'garlic_bread', 'gnocchi', 'greek_salad', 'grilled_cheese_sandwich',
+    'grilled_salmon', 'guacamole', 'gyoza', 'hamburger', 'hot_and_sour_soup',
+    'hot_dog', 'huevos_rancheros', 'hummus', 'ice_cream', 'lasagna',
+    'lobster_bisque', 'lobster_roll_sandwich', 'macaroni_and_cheese', 'macarons', 'miso_soup',
+    'mussels', 'nachos', 'omelette', 'onion_rings', 'oysters',
+    'pad_thai', 'paella', 'pancakes', 'panna_cotta', 'peking_duck',
+    'pho', 'pizza', 'pork_chop', 'poutine', 'prime_rib',
+    'pulled_pork_sandwich', 'ramen', 'ravioli', 'red_velvet_cake', 'risotto',
+    'samosa', 'sashimi', 'scallops', 'seaweed_salad', 'shrimp_and_grits',
+    'spaghetti_bolognese', 'spaghetti_carbonara', 'spring_rolls', 'steak', 'strawberry_shortcake',
+    'sushi', 'tacos', 'takoyaki', 'tiramisu', 'tuna_tartare', 'waffles'
+)
+
+# Simple rule-based alternatives (in a real implementation, this would use similarity models)
+_ALT_MAPPINGS: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+    'pizza': ('italian_food', 'cheese_pizza', 'pepperoni_pizza'),
+    'hamburger': ('cheeseburger', 'sandwich', 'fast_food'),
+    'hot_dog': ('sausage', 'fast_food', 'grilled_food'),
+    'french_fries': ('potato_fries', 'side_dish', 'fast_food'),
+    'chocolate_cake': ('dessert', 'cake', 'chocolate_dessert'),
+    'donuts': ('pastry', 'dessert', 'sweet_bread'),
+    'club_sandwich': ('sandwich', 'deli_sandwich', 'lunch_food')
+})
+
+# EXIF orientation -> (swap height and width, (C, H, W) dims to flip) that turns the stored pixels
+# upright, as cv2.imread does. nvJPEG leaves the orientation to the caller
+_EXIF_ORIENTATION_TRANSFORMS: Mapping[int, Tuple[bool, Tuple[int, ...]]] = MappingProxyType({
+    2: (False, (2,)),
+    3: (False, (1, 2)),
+    4: (False, (1,)),
+    5: (True, ()),
+    6: (True, (2,)),
+    7: (True, (1, 2)),
+    8: (True, (1,))
+})
+
+# Confidence multipliers for the first, second and third alternative suggestion
+_ALTERNATIVE_CONFIDENCE_FACTORS = (0.9, 0.8, 0.7)
+
+MODEL_INFO = {
+    'name': 'YOLOv8-Food101',
+    'version': '1.0.0'
+}
+
 class FoodDetectionModel:
     """Food detection model using YOLOv8 trained on Food-101 dataset"""
     
-    def __init__(self, model_path: Optional[str] = None, confidence_threshold: float = 0.5):
+    def __init__(self, model_path: Optional[str] = None, confidence_threshold: float = 0.5,
+                 use_tensorrt: bool = False, use_int8: bool = False, use_onnx: bool = False,
+                 num_threads: Optional[int] = None, cache_results: bool = True, use_cuda_graph: bool = False):
+        _import_dependencies()
+        
         self.confidence_threshold = confidence_threshold
+        self.use_cuda_graph = use_cuda_graph
+        self.cache_results = cache_results
+        self.use_tensorrt = use_tensorrt
+        self.use_int8 = use_int8
+        self.use_onnx = use_onnx
+        self.num_threads = num_threads
         self.model = None
+        self.device = 'cpu'
+        self.half = False
+        self.bgr_input = True  # Models loaded from PyTorch weights have the channel swap folded in
+        self.max_batch_size = MAX_BATCH_SIZE
+        self.model_id = None
+        self._cuda_graph = None
+        self._graph_output = None
+        self._result_cache = OrderedDict()
         self.class_names = self._get_food101_classes()
         
         # Initialize model
         self._load_model(model_path)
+        self._backend = self._load_backend()
+        self._allocate_buffers()
+        
+        # Resolve every model class to its food class once instead of per detection. The names come
+        # from AutoBackend, since YOLO.names would load an exported model a second time
+        self._food_classes = {
+            class_id: self._map_yolo_to_food(class_id, class_name)
+            for class_id, class_name in self._backend.names.items()
+        }
+        
+        if self.use_cuda_graph:
+            self._capture_cuda_graph()
     
     def _load_model(self, model_path: Optional[str] = None):
         """Load YOLOv8 model"""
         try:
             if model_path and Path(model_path).exists():
                 # Load custom trained model
-                self.model = YOLO(model_path)
-                logger.info(f"Loaded custom model from {model_path}")
+                weights = model_path
             else:
                 # Use pre-trained YOLOv8 model and adapt for food detection
                 # In a real implementation, this would be a model specifically trained on Food-101
                 # For now, we'll use the general YOLOv8 model and map relevant classes
-                self.model = YOLO('yolov8n.pt')  # Nano version for faster inference
+                weights = DEFAULT_WEIGHTS
+            
+            cuda_available = torch.cuda.is_available()
+            self.device = 'cuda' if cuda_available else 'cpu'
+            
+            if not cuda_available:
+                self._configure_cpu_threads()
+            
+            if Path(weights).suffix != '.pt':
+                # An already exported model (ONNX, TensorRT, OpenVINO, ...) is run as given: its first
+                # convolution cannot be folded, so it keeps taking RGB input, and its batch size is unknown
+                if self.use_tensorrt or self.use_int8 or self.use_onnx:
+                    logger.warning("Export options only apply to PyTorch weights, using the given model as is")
+                self.bgr_input = False
+                self.max_batch_size = 1
+                self.model = YOLO(weights, task='detect')
+                self.model_id = self._weights_fingerprint(weights)
+                logger.info(f"Loaded exported model from {weights}")
+                return
+            
+            if self.use_tensorrt:
+                if cuda_available:
+                    # Dynamic batch dimension so detect_food_batch can run up to MAX_BATCH_SIZE images at once
+                    self.model = self._load_exported_model(
+                        weights, f"{self._export_stem(weights)}_bgr_fp16_b{MAX_BATCH_SIZE}.engine",
+                        'TensorRT FP16 engine',
+                        format='engine', imgsz=INFERENCE_SIZE, half=True, device=0,
+                        dynamic=True, batch=MAX_BATCH_SIZE
+                    )
+                    self.half = True
+                    return
+                logger.warning("TensorRT requested but CUDA is not available, using PyTorch model")
+            
+            if self.use_int8:
+                if not cuda_available:
+                    # Calibrated on coco128, which Ultralytics downloads on first export.
+                    # The exported model has a static batch size of 1
+                    self.max_batch_size = 1
+                    self.model = self._load_exported_model(
+                        weights, f"{self._export_stem(weights)}_bgr_int8_openvino_model", 'OpenVINO INT8 model',
+                        format='openvino', imgsz=INFERENCE_SIZE, int8=True, data='coco128.yaml'
+                    )
+                    return
+                logger.warning("INT8 quantization is only used for CPU inference, using PyTorch model")
+            
+            if self.use_onnx:
+                # Ultralytics runs the exported graph through an ONNX Runtime session with all
+                # graph optimizations enabled. The export has a static batch size of 1
+                self.max_batch_size = 1
+                self.model = self._load_exported_model(
+                    weights, f"{self._export_stem(weights)}_bgr.onnx", 'ONNX model',
+                    format='onnx', imgsz=INFERENCE_SIZE, opset=12, simplify=True, dynamic=False
+                )
+                return
+            
+            self.model = self._load_bgr_model(weights)
+            # Ultralytics resolves the default weights to wherever it downloaded them
+            self.model_id = self._weights_fingerprint(getattr(self.model, 'ckpt_path', None) or weights)
+            if cuda_available and torch.cuda.get_device_capability(0)[0] >= 7:
+                # Volta and newer GPUs run FP16 convolutions on tensor cores
+                self.half = True
+                self.model_id += '_fp16'
+            
+            if weights == DEFAULT_WEIGHTS:
                 logger.info("Loaded YOLOv8 nano model (general object detection)")
+            else:
+                logger.info(f"Loaded custom model from {weights}")
                 
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             raise RuntimeError(f"Model loading failed: {e}")
     
-    def _get_food101_classes(self) -> List[str]:
+    def _load_backend(self):
+        """Wrap the loaded network, PyTorch or exported, so it runs directly on the input buffer"""
+        # Calling the YOLO object would go through Ultralytics' predictor, which checks the input
+        # range on the device and copies the whole input batch back to the host on every call.
+        # AutoBackend fuses and converts PyTorch weights to FP16 itself. Its first parameter was
+        # renamed from `weights` to `model` in Ultralytics 8.4, so it is passed positionally
+        return AutoBackend(
+            self.model.model,
+            device=torch.device('cuda:0' if self.device == 'cuda' else 'cpu'),
+            fp16=self.half,
+            fuse=True,
+            verbose=False
+        ).eval()
+    
+    def _configure_cpu_threads(self):
+        """Limit torch's CPU thread pools, which oversubscribe the cores on a model this small"""
+        num_threads = self.num_threads or max(1, (os.cpu_count() or 1) // 2)
+        torch.set_num_threads(num_threads)
+        
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Can only be set before torch starts any inter-op parallel work
+            logger.warning("Could not set inter-op threads, torch has already started its thread pool")
+        
+        logger.info(f"Using {num_threads} CPU threads for inference")
+    
+    def _load_bgr_model(self, weights: str):
+        """Load PyTorch weights with the channel swap folded into the network so it takes BGR input"""
+        model = YOLO(weights)
+        
+        # Reordering the first convolution's input channels is equivalent to feeding it RGB,
+        # so OpenCV's BGR images never need a separate conversion pass
+        first_conv = model.model.model[0].conv
+        first_conv.weight.data = first_conv.weight.data[:, [2, 1, 0]].contiguous()
+        
+        return model
+    
+    def _load_exported_model(self, weights: str, cache_name: str, description: str, **export_args):
+        """Load a cached exported model, exporting it from the PyTorch weights on first use"""
+        cached_path = CACHE_DIR / cache_name
+        
+        if not cached_path.exists():
+            logger.info(f"Exporting {weights} to {description} (one-time, may take a few minutes)")
+            exported = self._load_bgr_model(weights).export(**export_args)
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(exported), str(cached_path))
+        
+        logger.info(f"Loaded {description} from {cached_path}")
+        self.model_id = self._weights_fingerprint(str(cached_path))
+        return YOLO(str(cached_path), task='detect')
+    
+    def _export_stem(self, weights: str) -> str:
+        """Name exports after their source weights, keyed by path and fingerprint so replaced weights are re-exported"""
+        if weights == DEFAULT_WEIGHTS:
+            # Ultralytics' released weights never change
+            return Path(weights).stem
+        
+        source = f"{Path(weights).resolve()}:{self._weights_fingerprint(weights)}"
+        return f"{Path(weights).stem}_{hashlib.blake2b(source.encode('utf-8'), digest_size=8).hexdigest()}"
+    
+    def _weights_fingerprint(self, weights: str) -> str:
+        """Identify model weights by name, size and modification time, so replaced weights miss the result cache"""
+        try:
+            stat = os.stat(weights)
+        except OSError:
+            return Path(weights).name
+        return f"{Path(weights).name}:{stat.st_size}:{stat.st_mtime_ns}"
+    
+    def _get_food101_classes(self) -> Tuple[str, ...]:
         """Get Food-101 dataset class names"""
-        return [
-            'apple_pie', 'baby_back_ribs', 'baklava', 'beef_carpaccio', 'beef_tartare',
-            'beet_salad', 'beignets', 'bibimbap', 'bread_pudding', 'breakfast_burrito',
-            'bruschetta', 'caesar_salad', 'cannoli', 'caprese_salad', 'carrot_cake',
-            'ceviche', 'cheese_plate', 'cheesecake', 'chicken_curry', 'chicken_quesadilla',
-            'chicken_wings', 'chocolate_cake', 'chocolate_mousse', 'churros', 'clam_chowder',
-            'club_sandwich', 'crab_cakes', 'creme_brulee', 'croque_madame', 'cup_cakes',
-            'deviled_eggs', 'donuts', 'dumplings', 'edamame', 'eggs_benedict',
-            'escargots', 'falafel', 'filet_mignon', 'fish_and_chips', 'foie_gras',
-            'french_fries', 'french_onion_soup', 'french_toast', 'fried_calamari', 'fried_rice',
-            'frozen_yogurt', 'garlic_bread', 'gnocchi', 'greek_salad', 'grilled_cheese_sandwich',
-            'grilled_salmon', 'guacamole', 'gyoza', 'hamburger', 'hot_and_sour_soup',
-            'hot_dog', 'huevos_rancheros', 'hummus', 'ice_cream', 'lasagna',
-            'lobster_bisque', 'lobster_roll_sandwich', 'macaroni_and_cheese', 'macarons', 'miso_soup',
-            'mussels', 'nachos', 'omelette', 'onion_rings', 'oysters',
-            'pad_thai', 'paella', 'pancakes', 'panna_cotta', 'peking_duck',
-            'pho', 'pizza', 'pork_chop', 'poutine', 'prime_rib',
-            'pulled_pork_sandwich', 'ramen', 'ravioli', 'red_velvet_cake', 'risotto',
-            'samosa', 'sashimi', 'scallops', 'seaweed_salad', 'shrimp_and_grits',
-            'spaghetti_bolognese', 'spaghetti_carbonara', 'spring_rolls', 'steak', 'strawberry_shortcake',
-            'sushi', 'tacos', 'takoyaki', 'tiramisu', 'tuna_tartare', 'waffles'
-        ]
+        return _FOOD101_CLASSES
     
-    def _map_yolo_to_food(self, class_id: int, class_name: str) -> Optional[str]:
+    def _map_yolo_to_food(self, class_id: int, class_name: str) -> str:
         """Map YOLO class to food class (temporary mapping until we have a food-specific model)"""
-        # Mapping common YOLO classes to food categories
-        food_mappings = {
-            'apple': 'apple_pie',
-            'banana': 'banana',
-            'orange': 'orange',
-            'sandwich': 'club_sandwich',
-            'pizza': 'pizza',
-            'donut': 'donuts',
-            'cake': 'chocolate_cake',
-            'hot dog': 'hot_dog',
-            'hamburger': 'hamburger',
-            'french fries': 'french_fries'
-        }
-        
         class_name_lower = class_name.lower()
-        for yolo_class, food_class in food_mappings.items():
+        food_class = _EXACT_FOOD_MAPPINGS.get(class_name_lower)
+        if food_class:
+            return food_class
+        
+        for yolo_class, food_class in _FOOD_MAPPINGS:
             if yolo_class in class_name_lower:
                 return food_class
         
         # If no mapping found, return a generic food class
         return 'unknown_food'
     
-    def preprocess_image(self, image_path: str) -> np.ndarray:
-        """Preprocess image for food detection"""
+    def preprocess_image(self, image_path: str,
+                         out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+        """Load an image and letterbox it to the square inference size, reusing the image buffer"""
         try:
             # Load image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Could not load image from {image_path}")
+            image, decode_scale = self._read_image(image_path)
+            
+            # Kept in BGR order, which the model takes directly unless it was loaded pre-exported
+            out, scale, pad = self._letterbox(image, self._img_buf if out is None else out)
+            if not self.bgr_input:
+                cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+            return out, scale * decode_scale, pad
             
-            # Convert BGR to RGB
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        except Exception as e:
+            logger.error(f"Image preprocessing failed: {e}")
+            raise
+    
+    def _read_image(self, image_path: str) -> Tuple[np.ndarray, float]:
+        """Read a BGR image, downscaling large JPEGs during decode; returns the image and its scale"""
+        longest_side, is_jpeg, _ = self._read_header(image_path)
+        
+        # libjpeg can decode at 1/2, 1/4 or 1/8 size in the DCT domain. Use the smallest that
+        # still covers the inference size so the letterbox only ever downscales
+        flags = cv2.IMREAD_COLOR
+        if is_jpeg:
+            for factor, reduced_flags in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                          (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if longest_side // factor >= INFERENCE_SIZE:
+                    flags = reduced_flags
+                    break
+        
+        image = cv2.imread(image_path, flags)
+        if image is None:
+            raise ValueError(f"Could not load image from {image_path}")
+        
+        decode_scale = max(image.shape[:2]) / longest_side if flags != cv2.IMREAD_COLOR else 1.0
+        return image, decode_scale
+    
+    def _read_header(self, image_path: str) -> Tuple[int, bool, int]:
+        """Read an image's longest side, whether it is a JPEG and its EXIF orientation"""
+        try:
+            with Image.open(image_path) as header:
+                # Only parses the header, the pixel data is not decoded
+                return max(header.size), header.format == 'JPEG', header.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        except (OSError, ValueError):
+            return 0, False, 1
+    
+    def preprocess_image_gpu(self, image_path: str, index: int = 0) -> Tuple[torch.Tensor, float, Tuple[int, int]]:
+        """Decode and letterbox an image on the GPU into slot `index` of the input buffer"""
+        try:
+            if not Path(image_path).is_file():
+                raise ValueError(f"Could not load image from {image_path}")
             
-            # Basic preprocessing - resize if too large
-            height, width = image.shape[:2]
-            max_size = 1024
+            out = self._input_buf[index]
+            data = torchvision.io.read_file(image_path)
+            try:
+                # nvJPEG decodes straight into GPU memory, skipping the CPU decode and upload
+                image = torchvision.io.decode_jpeg(data, mode=ImageReadMode.RGB, device='cuda')
+            except RuntimeError:
+                # Not a JPEG: letterbox on the CPU into pinned memory and upload asynchronously
+                staging = self._pinned_buf[index]
+                _, scale, pad = self.preprocess_image(image_path, staging.numpy())
+                out.copy_(staging.permute(2, 0, 1), non_blocking=True).div_(255)
+                return out, scale, pad
             
-            if max(height, width) > max_size:
-                scale = max_size / max(height, width)
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+            # Turn phone photos upright like the CPU path does, and flip nvJPEG's RGB to the model's
+            # BGR order. The transpose is a view and the flips run after the downscale, so neither
+            # copies the full-resolution image
+            _, _, orientation = self._read_header(image_path)
+            transpose, flip_dims = _EXIF_ORIENTATION_TRANSFORMS.get(orientation, (False, ()))
+            if transpose:
+                image = image.transpose(1, 2)
+            if self.bgr_input:
+                flip_dims = (0,) + flip_dims
             
-            return image
+            return self._letterbox_tensor(image.float(), out, flip_dims)
             
         except Exception as e:
-            logger.error(f"Image preprocessing failed: {e}")
+            logger.error(f"GPU image preprocessing failed: {e}")
             raise
     
-    def detect_food(self, image_path: str, max_detections: int = 5) -> List[Dict]:
+    def detect_food(self, image_path: str, max_detections: int = 5) -> Tuple[List[Dict], float]:
         """Detect food items in image"""
         try:
             start_time = time.time()
             
-            # Preprocess image
-            image = self.preprocess_image(image_path)
-            
-            # Run inference
-            results = self.model(image, conf=self.confidence_threshold, verbose=False)
+            cache_key = self._result_cache_key(image_path, max_detections) if self.cache_results else None
+            if cache_key:
+                cached = self._load_cached_result(cache_key)
+                if cached is not None:
+                    return cached, time.time() - start_time
             
-            detections = []
-            
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for i, box in enumerate(boxes):
-                        if i >= max_detections:
-                            break
-                            
-                        # Get detection data
-                        confidence = float(box.conf[0])
-                        class_id = int(box.cls[0])
-                        bbox = box.xyxy[0].tolist()  # [x1, y1, x2, y2]
-                        
-                        # Convert to [x, y, width, height] format
-                        x1, y1, x2, y2 = bbox
-                        bbox_formatted = [x1, y1, x2 - x1, y2 - y1]
-                        
-                        # Get class name
-                        original_class_name = self.model.names[class_id]
-                        
-                        # Map to food class
-                        food_class = self._map_yolo_to_food(class_id, original_class_name)
-                        
-                        if food_class and confidence >= self.confidence_threshold:
-                            detection = {
-                                'class_name': food_class,
-                                'confidence': confidence,
-                                'bbox': bbox_formatted,
-                                'alternatives': self._get_alternatives(food_class, confidence)
-                            }
-                            detections.append(detection)
+            with self._inference_stream():
+                # Preprocess straight into the preallocated model input
+                scale, pad = self._prepare_input(0, image_path)
+                
+                # Run inference
+                boxes = self._infer(1, max_detections)[0]
+                
+                # Top detections, already sorted by confidence
+                detections = self._extract_detections(boxes, scale, pad)
             
             processing_time = time.time() - start_time
             
-            # Sort by confidence
-            detections.sort(key=lambda x: x['confidence'], reverse=True)
+            if cache_key:
+                self._store_cached_result(cache_key, detections)
             
-            return detections[:max_detections], processing_time
+            return detections, processing_time
             
         except Exception as e:
             logger.error(f"Food detection failed: {e}")
             raise
     
+    def detect_food_batch(self, image_paths: List[str], max_detections: int = 5) -> Tuple[List[List[Dict]], float]:
+        """Detect food items in several images with one forward pass per batch"""
+        try:
+            start_time = time.time()
+            all_detections = []
+            
+            for batch_start in range(0, len(image_paths), self.max_batch_size):
+                batch_paths = image_paths[batch_start:batch_start + self.max_batch_size]
+                
+                with self._inference_stream():
+                    # Letterbox every image into its slot of the preallocated (B, 3, S, S) input. On the GPU
+                    # the uploads are queued without blocking, so the next image is read while they run
+                    letterboxes = [
+                        self._prepare_input(index, image_path) for index, image_path in enumerate(batch_paths)
+                    ]
+                    
+                    for boxes, (scale, pad) in zip(self._infer(len(batch_paths), max_detections), letterboxes):
+                        all_detections.append(self._extract_detections(boxes, scale, pad))
+            
+            return all_detections, time.time() - start_time
+            
+        except Exception as e:
+            logger.error(f"Batch food detection failed: {e}")
+            raise
+    
+    def _infer(self, batch_size: int, max_detections: int) -> List[Boxes]:
+        """Run the first `batch_size` slots of the input buffer through the network and NMS"""
+        with torch.no_grad():
+            if self._cuda_graph is not None and batch_size == 1:
+                # Replay the captured forward pass on the input buffer
+                self._cuda_graph.replay()
+                predictions = self._graph_output
+            else:
+                predictions = self._backend(self._input_buf[:batch_size])
+            
+            # NMS runs on the predictions' device and returns each image's boxes above the confidence
+            # threshold, sorted by confidence and capped at max_detections. They stay in letterboxed
+            # coordinates until _extract_detections maps them back
+            predictions = non_max_suppression(
+                predictions, self.confidence_threshold, NMS_IOU_THRESHOLD, max_det=max_detections
+            )
+        
+        return [Boxes(image_predictions, (INFERENCE_SIZE, INFERENCE_SIZE)) for image_predictions in predictions]
+    
+    def _result_cache_key(self, image_path: str, max_detections: int) -> Optional[str]:
+        """Hash the image contents together with every setting that affects the detections"""
+        digest = hashlib.blake2b(digest_size=16)
+        try:
+            with open(image_path, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            # Unreadable images are reported by preprocessing
+            return None
+        
+        digest.update(f"{self.model_id}:{self.confidence_threshold}:{max_detections}".encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _load_cached_result(self, cache_key: str) -> Optional[List[Dict]]:
+        """Look up cached detections in memory, then on disk"""
+        if cache_key in self._result_cache:
+            self._result_cache.move_to_end(cache_key)
+            return self._result_cache[cache_key]
+        
+        cache_path = RESULT_CACHE_DIR / f"{cache_key}.json"
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                detections = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        self._remember_result(cache_key, detections)
+        return detections
+    
+    def _store_cached_result(self, cache_key: str, detections: List[Dict]):
+        """Cache detections in memory and on disk"""
+        self._remember_result(cache_key, detections)
+        
+        try:
+            RESULT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # Write then rename so concurrent processes never read a partial file
+            tmp_path = RESULT_CACHE_DIR / f"{cache_key}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(detections, f)
+            os.replace(tmp_path, RESULT_CACHE_DIR / f"{cache_key}.json")
+            self._prune_result_cache()
+        except OSError as e:
+            logger.warning(f"Could not write result cache: {e}")
+    
+    def _prune_result_cache(self):
+        """Delete the oldest cached results once the disk cache holds more than RESULT_DISK_CACHE_SIZE"""
+        entries = []
+        with os.scandir(RESULT_CACHE_DIR) as it:
+            for entry in it:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    entries.append((entry.stat().st_mtime_ns, entry.path))
+                except FileNotFoundError:
+                    # Pruned by another process
+                    continue
+        
+        if len(entries) <= RESULT_DISK_CACHE_SIZE:
+            return
+        
+        for _, path in heapq.nsmallest(len(entries) - RESULT_DISK_CACHE_SIZE, entries):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+    
+    def _remember_result(self, cache_key: str, detections: List[Dict]):
+        """Add detections to the in-process LRU cache used by long-running services"""
+        self._result_cache[cache_key] = detections
+        self._result_cache.move_to_end(cache_key)
+        if len(self._result_cache) > RESULT_MEMORY_CACHE_SIZE:
+            self._result_cache.popitem(last=False)
+    
+    def _prepare_input(self, index: int, image_path: str) -> Tuple[float, Tuple[int, int]]:
+        """Preprocess an image into slot `index` of the input buffer, returning its letterbox scale and padding"""
+        if self.device == 'cuda':
+            _, scale, pad = self.preprocess_image_gpu(image_path, index)
+        else:
+            image, scale, pad = self.preprocess_image(image_path)
+            self._fill_input(index, image)
+        return scale, pad
+    
+    def _inference_stream(self):
+        """Context that queues preprocessing and inference on the dedicated CUDA stream, if any"""
+        if self._stream is None:
+            return contextlib.nullcontext()
+        return torch.cuda.stream(self._stream)
+    
+    def _capture_cuda_graph(self):
+        """Record the forward pass on the static input buffer so each call replays it as a single launch"""
+        if self.device != 'cuda' or not isinstance(getattr(self._backend, 'model', None), torch.nn.Module):
+            logger.warning("CUDA graphs need the PyTorch model on a GPU, running without them")
+            return
+        
+        # AutoBackend has already fused the network and then converted it to FP16, so the fused
+        # convolutions match the input dtype. Inference never goes through Ultralytics' predictor,
+        # so nothing moves or converts these parameters after capture
+        net = self._backend.model
+        static_input = self._input_buf[:1]
+        static_input.zero_()
+        
+        with torch.no_grad():
+            # Warm up on a side stream so lazy initialisation (anchors, cuDNN tactics) is not captured
+            side_stream = torch.cuda.Stream()
+            side_stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(side_stream):
+                for _ in range(CUDA_GRAPH_WARMUP_RUNS):
+                    net(static_input)
+            torch.cuda.current_stream().wait_stream(side_stream)
+            
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                output = net(static_input)
+        
+        # In eval mode the detection head returns (predictions, feature maps)
+        self._graph_output = output[0] if isinstance(output, (tuple, list)) else output
+        self._cuda_graph = graph
+        logger.info("Captured CUDA graph for single-image inference")
+    
+    def _allocate_buffers(self):
+        """Allocate the image and model input buffers reused by every inference call"""
+        self._img_buf = np.empty((INFERENCE_SIZE, INFERENCE_SIZE, 3), dtype=np.uint8)
+        self._input_buf = torch.empty(
+            (self.max_batch_size, 3, INFERENCE_SIZE, INFERENCE_SIZE),
+            dtype=torch.float16 if self.half else torch.float32, device=self.device
+        )
+        
+        self._pinned_buf = None
+        self._stream = None
+        if self.device == 'cuda':
+            # Page-locked staging for images decoded on the CPU, so their upload can run asynchronously.
+            # Reading results back to the host synchronizes the stream before any slot is reused
+            self._pinned_buf = torch.empty(
+                (self.max_batch_size, INFERENCE_SIZE, INFERENCE_SIZE, 3), dtype=torch.uint8, pin_memory=True
+            )
+            self._stream = torch.cuda.Stream()
+    
+    def _fill_input(self, index: int, image: np.ndarray):
+        """Copy a letterboxed (S, S, 3) uint8 image into the input buffer, scaled to [0, 1]"""
+        # The HWC -> CHW transpose, float conversion and scaling happen in a single pass over the
+        # strided uint8 view, with no intermediate copy
+        torch.div(torch.from_numpy(image).permute(2, 0, 1), 255, out=self._input_buf[index])
+    
+    def _letterbox(self, image: np.ndarray, out: np.ndarray) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+        """Resize and pad an image into the square `out` buffer, keeping its aspect ratio"""
+        height, width = image.shape[:2]
+        scale = INFERENCE_SIZE / max(height, width)
+        new_width = round(width * scale)
+        new_height = round(height * scale)
+        
+        if (new_width, new_height) != (width, height):
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+            image = cv2.resize(image, (new_width, new_height), interpolation=interpolation)
+        
+        pad_x = (INFERENCE_SIZE - new_width) // 2
+        pad_y = (INFERENCE_SIZE - new_height) // 2
+        cv2.copyMakeBorder(
+            image, pad_y, INFERENCE_SIZE - new_height - pad_y, pad_x, INFERENCE_SIZE - new_width - pad_x,
+            cv2.BORDER_CONSTANT, dst=out, value=LETTERBOX_COLOR
+        )
+        
+        return out, scale, (pad_x, pad_y)
+    
+    def _letterbox_tensor(self, image: torch.Tensor, out: torch.Tensor,
+                          flip_dims: Tuple[int, ...] = ()) -> Tuple[torch.Tensor, float, Tuple[int, int]]:
+        """GPU counterpart of _letterbox, writing floats in [0, 1] into a (3, S, S) `out` tensor"""
+        height, width = image.shape[1:]
+        scale = INFERENCE_SIZE / max(height, width)
+        new_width = round(width * scale)
+        new_height = round(height * scale)
+        
+        if (new_width, new_height) != (width, height):
+            if scale < 1:
+                image = F.interpolate(image[None], size=(new_height, new_width), mode='area')[0]
+            else:
+                image = F.interpolate(image[None], size=(new_height, new_width), mode='bilinear',
+                                      align_corners=False)[0]
+        
+        if flip_dims:
+            # Flipping the resized image is equivalent to flipping the source, and far smaller
+            image = image.flip(flip_dims)
+        
+        pad_x = (INFERENCE_SIZE - new_width) // 2
+        pad_y = (INFERENCE_SIZE - new_height) // 2
+        out.fill_(LETTERBOX_COLOR[0] / 255)
+        out[:, pad_y:pad_y + new_height, pad_x:pad_x + new_width] = image.div_(255)
+        
+        return out, scale, (pad_x, pad_y)
+    
+    def _extract_detections(self, boxes, scale: float = 1.0, pad: Tuple[int, int] = (0, 0)) -> List[Dict]:
+        """Convert one image's Ultralytics boxes into its top detections by confidence, undoing any letterboxing"""
+        if boxes is None or len(boxes) == 0:
+            return []
+        
+        # NMS has already filtered, ranked and capped the boxes, so all of them are returned
+        # One device -> host copy per tensor instead of per box. FP16 models produce half-precision
+        # boxes, which would round coordinates on large photos once scaled back, so copy as float32
+        confidences = boxes.conf.float().cpu().numpy()
+        class_ids = boxes.cls.cpu().numpy().astype(int)
+        bboxes = boxes.xyxy.float().cpu().numpy()  # [x1, y1, x2, y2]
+        
+        # Convert to [x, y, width, height] format in the source image's coordinates
+        pad_x, pad_y = pad
+        bboxes[:, 0::2] -= pad_x
+        bboxes[:, 1::2] -= pad_y
+        bboxes /= scale
+        bboxes[:, 2:] -= bboxes[:, :2]
+        
+        # Every model class maps to a food class, falling back to 'unknown_food'
+        return [
+            {
+                'class_name': self._food_classes[class_id],
+                'confidence': confidence,
+                'bbox': bbox,
+                'alternatives': self._get_alternatives(self._food_classes[class_id], confidence)
+            }
+            for confidence, class_id, bbox in zip(confidences.tolist(), class_ids.tolist(), bboxes.tolist())
+        ]
+    
     def _get_alternatives(self, primary_class: str, primary_confidence: float) -> List[Dict]:
         """Generate alternative food suggestions based on the primary detection"""
-        alternatives = []
-        
-        # Simple rule-based alternatives (in a real implementation, this would use similarity models)
-        alternative_mappings = {
-            'pizza': ['italian_food', 'cheese_pizza', 'pepperoni_pizza'],
-            'hamburger': ['cheeseburger', 'sandwich', 'fast_food'],
-            'hot_dog': ['sausage', 'fast_food', 'grilled_food'],
-            'french_fries': ['potato_fries', 'side_dish', 'fast_food'],
-            'chocolate_cake': ['dessert', 'cake', 'chocolate_dessert'],
-            'donuts': ['pastry', 'dessert', 'sweet_bread'],
-            'club_sandwich': ['sandwich', 'deli_sandwich', 'lunch_food']
-        }
+        # Top 3 alternatives, with confidence reduced by rank
+        return [
+            {
+                'class_name': alt_class,
+                'confidence': primary_confidence * factor
+            }
+            for alt_class, factor in zip(_ALT_MAPPINGS.get(primary_class, ()), _ALTERNATIVE_CONFIDENCE_FACTORS)
+        ]
+
+def build_response(detections: List[Dict], processing_time: float) -> Dict:
+    """Build the JSON response returned to the Node.js backend"""
+    return {
+        'detections': detections,
+        'processing_time': processing_time,
+        'model_info': dict(MODEL_INFO)
+    }
+
+def build_error_response(error: Exception) -> Dict:
+    """Build the JSON error response returned to the Node.js backend"""
+    response = build_response([], 0)
+    response['error'] = str(error)
+    return response
+
+class DetectionRequestHandler(socketserver.StreamRequestHandler):
+    """Handle newline-delimited JSON detection requests on a warm model"""
+    
+    # Requests are served one connection at a time, so an idle client must not hold the service
+    timeout = CONNECTION_TIMEOUT
+    
+    def handle(self):
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                
+                try:
+                    request = json.loads(line)
+                    detections, processing_time = self.server.detector.detect_food(
+                        request['image'],
+                        max_detections=int(request.get('max_detections', self.server.max_detections))
+                    )
+                    response = build_response(detections, processing_time)
+                except Exception as e:
+                    response = build_error_response(e)
+                
+                self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+                self.wfile.flush()
+        except OSError as e:
+            # Idle timeout or client disconnect; drop the connection and serve the next one
+            logger.warning(f"Closing detection client connection: {e}")
+
+class DetectionServer(socketserver.UnixStreamServer):
+    """Unix socket server that keeps a single model resident between requests"""
+    
+    # socketserver's default backlog of 5 refuses bursts of concurrent uploads
+    request_queue_size = REQUEST_QUEUE_SIZE
+    
+    def __init__(self, socket_path: str, detector: FoodDetectionModel, max_detections: int):
+        self.detector = detector
+        self.max_detections = max_detections
+        
+        self._remove_stale_socket(socket_path)
+        super().__init__(socket_path, DetectionRequestHandler)
+        # Remembered so shutdown only removes this server's socket, not one bound later at the same path.
+        # Inode numbers are reused once a file is deleted, so the creation time is compared too
+        self._socket_identity = self._socket_file_identity()
+    
+    def _remove_stale_socket(self, socket_path: str):
+        """Remove a socket left behind by a previous run, refusing to touch anything else at the path"""
+        try:
+            mode = os.stat(socket_path).st_mode
+        except FileNotFoundError:
+            return
+        
+        if not stat.S_ISSOCK(mode):
+            raise RuntimeError(f"{socket_path} exists and is not a socket")
         
-        if primary_class in alternative_mappings:
-            for alt_class in alternative_mappings[primary_class][:3]:  # Top 3 alternatives
-                # Reduce confidence for alternatives
-                alt_confidence = primary_confidence * (0.7 + np.random.random() * 0.2)
-                alternatives.append({
-                    'class_name': alt_class,
-                    'confidence': alt_confidence
-                })
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nothing is listening, so the socket is stale
+                os.unlink(socket_path)
+                return
         
-        return alternatives
+        raise RuntimeError(f"Another detection service is already listening on {socket_path}")
+    
+    def remove_socket(self):
+        """Remove the listening socket, unless it has already been removed or replaced"""
+        try:
+            if self._socket_file_identity() == self._socket_identity:
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+    
+    def _socket_file_identity(self) -> Tuple[int, int, int]:
+        """Identify the file currently at the socket path"""
+        file_stat = os.stat(self.server_address)
+        return file_stat.st_dev, file_stat.st_ino, file_stat.st_ctime_ns
+
+def serve(detector: FoodDetectionModel, socket_path: str, max_detections: int):
+    """Serve detection requests until interrupted"""
+    with DetectionServer(socket_path, detector, max_detections) as server:
+        logger.info(f"Food detection service listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.remove_socket()
 
 def main():
     """Main function for command-line interface"""
     parser = argparse.ArgumentParser(description='Food Detection Service')
-    parser.add_argument('--image', required=True, help='Path to input image')
+    parser.add_argument('--image', help='Path to input image')
     parser.add_argument('--confidence', type=float, default=0.5, help='Confidence threshold')
     parser.add_argument('--max-detections', type=int, default=5, help='Maximum number of detections')
     parser.add_argument('--model-path', help='Path to custom model file')
+    parser.add_argument('--tensorrt', action='store_true',
+                        help='Run inference through a cached TensorRT FP16 engine (CUDA only)')
+    parser.add_argument('--int8', action='store_true',
+                        help='Run inference through a cached OpenVINO INT8 model (CPU only)')
+    parser.add_argument('--onnx', action='store_true',
+                        help='Run inference through a cached ONNX model with ONNX Runtime')
+    parser.add_argument('--threads', type=int,
+                        help='CPU threads used for inference (default: half the available cores)')
+    parser.add_argument('--cuda-graph', action='store_true',
+                        help='Replay single-image inference from a captured CUDA graph (PyTorch model on GPU only)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always run inference instead of reusing cached results for identical images')
+    parser.add_argument('--serve', action='store_true',
+                        help='Keep the model loaded and serve requests on a Unix socket')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH,
+                        help=f'Unix socket path used with --serve (default: {DEFAULT_SOCKET_PATH})')
     
     args = parser.parse_args()
     
+    if not args.serve and not args.image:
+        parser.error('--image is required unless --serve is given')
+    
     try:
         # Initialize model
         detector = FoodDetectionModel(
             model_path=args.model_path,
-            confidence_threshold=args.confidence
+            confidence_threshold=args.confidence,
+            use_tensorrt=args.tensorrt,
+            use_int8=args.int8,
+            use_onnx=args.onnx,
+            num_threads=args.threads,
+            cache_results=not args.no_cache,
+            use_cuda_graph=args.cuda_graph
         )
         
+        if args.serve:
+            serve(detector, args.socket, args.max_detections)
+            return
+        
         # Detect food
         detections, processing_time = detector.detect_food(
             args.image,
             max_detections=args.max_detections
         )
         
-        # Prepare response
-        response = {
-            'detections': detections,
-            'processing_time': processing_time,
-            'model_info': {
-                'name': 'YOLOv8-Food101',
-                'version': '1.0.0'
-            }
-        }
-        
         # Output JSON response
-        print(json.dumps(response, indent=2))
+        print(json.dumps(build_response(detections, processing_time), indent=2))
         
     except Exception as e:
-        error_response = {
-            'error': str(e),
-            'detections': [],
-            'processing_time': 0,
-            'model_info': {
-                'name': 'YOLOv8-Food101',
-                'version': '1.0.0'
-            }
-        }
-        print(json.dumps(error_response, indent=2), file=sys.stderr)
+        print(json.dumps(build_error_response(e), indent=2), file=sys.stderr)
         sys.exit(1)
 
 if __name__ == '__main__':